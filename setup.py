@@ -56,6 +56,7 @@ setup(
     entry_points={
         'console_scripts': [
             'vcdb=vcdb.command:main',
+            'vcdb-merge=vcdb.command:merge_main',
         ],
     },
 )
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Benchmark for converting Subversion log entries to rows.
+
+Run it from the project folder using::
+
+  $ python -m tests.bench_conversion
+"""
+# Copyright (C) 2016 Thomas Aglassinger.
+# Distributed under the GNU Lesser General Public License v3 or later.
+import timeit
+from xml.etree import ElementTree
+
+from vcdb import common
+from vcdb import subversion
+
+import tests
+
+#: Number of log entries to convert.
+LOGENTRY_COUNT = 5000
+
+#: Number of times to repeat each benchmark; the fastest run counts.
+REPEAT_COUNT = 5
+
+
+def _svn_log_root(logentry_count):
+    log_element = ElementTree.Element('log')
+    for commit_number in range(1, logentry_count + 1):
+        logentry_element = ElementTree.SubElement(log_element, 'logentry', revision=str(commit_number))
+        ElementTree.SubElement(logentry_element, 'author').text = 'alice'
+        ElementTree.SubElement(logentry_element, 'date').text = '2016-07-01T10:11:%02d.123456Z' % (
+            commit_number % 60)
+        paths_element = ElementTree.SubElement(logentry_element, 'paths')
+        for path_number in range(4):
+            path_attributes = {'action': 'M', 'kind': 'file'}
+            if (commit_number > 1) and (path_number == 0):
+                path_attributes.update({
+                    'action': 'A',
+                    'copyfrom-path': '/trunk/copied_%d.py' % (commit_number - 1),
+                    'copyfrom-rev': str(commit_number - 1),
+                })
+            path_element = ElementTree.SubElement(paths_element, 'path', **path_attributes)
+            path_element.text = '/trunk/copied_%d.py' % commit_number if path_number == 0 \
+                else '/trunk/source_%d.py' % path_number
+        ElementTree.SubElement(logentry_element, 'msg').text = 'Changed stuff.'
+    return log_element
+
+
+def _convert_to_orm_objects(repository, log_root):
+    result = []
+    for logentry_element in log_root.iterfind('logentry[@revision]'):
+        change = subversion.change_from_logentry_element(repository, logentry_element)
+        result.append(change)
+        for path_element in logentry_element.iterfind('paths/path'):
+            result.append(subversion.path_from_path_element(change, path_element))
+    return result
+
+
+def _convert_to_rows(repository, log_root):
+    result = []
+    commit_id_to_change_id_map = {}
+    for logentry_element in log_root.iterfind('logentry[@revision]'):
+        change_row = subversion.change_row_from_logentry_element(repository.repository_id, logentry_element)
+        result.append(change_row)
+        result.extend(subversion.path_rows_from_logentry_element(
+            change_row, logentry_element, commit_id_to_change_id_map))
+    return result
+
+
+def _conversion_seconds(convert_function, repository, log_root):
+    return min(timeit.repeat(lambda: convert_function(repository, log_root), number=1, repeat=REPEAT_COUNT))
+
+
+def main():
+    log_root = _svn_log_root(LOGENTRY_COUNT)
+    repository = common.Repository(repository_id=1, uri='file://localhost/tmp/bench/')
+    orm_seconds = _conversion_seconds(_convert_to_orm_objects, repository, log_root)
+    row_seconds = _conversion_seconds(_convert_to_rows, repository, log_root)
+    tests.log.info(
+        'convert %d log entries: %.1f ms for ORM objects, %.1f ms for rows, %.1fx faster',
+        LOGENTRY_COUNT, 1000 * orm_seconds, 1000 * row_seconds, orm_seconds / row_seconds)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.INFO)
+    main()
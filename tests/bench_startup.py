@@ -0,0 +1,135 @@
+"""
+Benchmark for the startup time of the vcdb command line client compared to
+an older revision.
+
+Run it from the project folder using for example::
+
+  $ python -m tests.bench_startup v0.1
+
+Timing runs of an already up to date repository requires the Subversion
+command line tools ``svn`` and ``svnadmin``; without them only ``--help`` and
+``--version`` are timed.
+"""
+# Copyright (C) 2016 Thomas Aglassinger.
+# Distributed under the GNU Lesser General Public License v3 or later.
+import argparse
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import timeit
+
+import sqlalchemy
+
+from vcdb import common
+
+import tests
+
+#: Number of times to repeat each benchmark; the fastest run counts.
+REPEAT_COUNT = 10
+
+_PROJECT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _export_revision(revision, target_folder):
+    common.ensure_folder_is_empty(target_folder)
+    archive_bytes = subprocess.check_output(['git', 'archive', revision, 'vcdb'], cwd=_PROJECT_FOLDER)
+    with tarfile.open(fileobj=io.BytesIO(archive_bytes)) as archive:
+        archive.extractall(target_folder)
+
+
+def _vcdb_seconds(source_folder, arguments):
+    """
+    Fastest time to run ``vcdb`` with ``arguments`` using the vcdb package in
+    ``source_folder``.
+    """
+    command = [sys.executable, '-m', 'vcdb.command'] + arguments
+
+    def run_vcdb():
+        subprocess.check_call(command, cwd=source_folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    return min(timeit.repeat(run_vcdb, number=1, repeat=REPEAT_COUNT))
+
+
+def _log_comparison(topic, before_seconds, after_seconds):
+    tests.log.info(
+        '%s: %.1f ms before, %.1f ms after, %.1fx faster',
+        topic, 1000 * before_seconds, 1000 * after_seconds, before_seconds / after_seconds)
+
+
+def _connect_using_create_all(engine_uri):
+    engine = sqlalchemy.create_engine(engine_uri)
+    common.DeclarativeBase.metadata.create_all(engine)
+    engine.dispose()
+
+
+def _connect_using_schema_version(engine_uri):
+    common.vcdb_session(engine_uri).get_bind().dispose()
+
+
+def _connect_statement_count(connect_function, engine_uri):
+    """
+    Number of SQL statements sent to the database by ``connect_function``,
+    which matters more than its time for database servers on the network.
+    """
+    statements = []
+
+    def count_statement(*_):
+        statements.append(None)
+
+    sqlalchemy.event.listen(sqlalchemy.engine.Engine, 'before_cursor_execute', count_statement)
+    try:
+        connect_function(engine_uri)
+    finally:
+        sqlalchemy.event.remove(sqlalchemy.engine.Engine, 'before_cursor_execute', count_statement)
+    return len(statements)
+
+
+def _benchmark_up_to_date(baseline_folder):
+    # Import here because test_subversion requires the svn command line client.
+    from tests import test_subversion
+
+    repository_builder = test_subversion.TestRepositoryBuilder('bench_startup_repository')
+    repository_builder.build()
+    for topic, source_folder in [('before', baseline_folder), ('after', _PROJECT_FOLDER)]:
+        database_path = os.path.join(tests.TEMP_FOLDER, 'bench_startup_%s.db' % topic)
+        common.ensure_is_removed(database_path)
+        arguments = [repository_builder.repository_uri, 'sqlite:///' + database_path]
+        # Sync once so all later runs find the repository up to date.
+        subprocess.check_call([sys.executable, '-m', 'vcdb.command'] + arguments, cwd=source_folder)
+        yield _vcdb_seconds(source_folder, arguments)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='benchmark startup time of vcdb compared to an older revision')
+    parser.add_argument('revision', metavar='REVISION', help='git revision to compare with, for example v0.1')
+    args = parser.parse_args(arguments)
+
+    baseline_folder = os.path.join(tests.TEMP_FOLDER, 'bench_startup_baseline')
+    _export_revision(args.revision, baseline_folder)
+    for vcdb_arguments in [['--help'], ['--version']]:
+        _log_comparison(
+            'vcdb ' + ' '.join(vcdb_arguments),
+            _vcdb_seconds(baseline_folder, vcdb_arguments),
+            _vcdb_seconds(_PROJECT_FOLDER, vcdb_arguments))
+    if (shutil.which('svn') is not None) and (shutil.which('svnadmin') is not None):
+        _log_comparison('vcdb on up to date repository', *_benchmark_up_to_date(baseline_folder))
+    else:
+        tests.log.warning('skipped vcdb on up to date repository because svn and svnadmin must be installed')
+
+    database_path = os.path.join(tests.TEMP_FOLDER, 'bench_startup.db')
+    common.ensure_is_removed(database_path)
+    engine_uri = 'sqlite:///' + database_path
+    common.vcdb_session(engine_uri).get_bind().dispose()
+    tests.log.info(
+        'SQL statements to connect to existing database: %d before, %d after',
+        _connect_statement_count(_connect_using_create_all, engine_uri),
+        _connect_statement_count(_connect_using_schema_version, engine_uri))
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -5,6 +5,8 @@ Tests for vcdb command line interface.
 # Distributed under the GNU Lesser General Public License v3 or later.
 import os.path
 import sqlite3
+import subprocess
+import sys
 import unittest
 from contextlib import closing
 
@@ -31,6 +33,19 @@ class CommandTest(unittest.TestCase):
         except SystemExit as error:
             self.assertEqual(error.code, 0)
 
+    def test_can_import_without_sqlalchemy(self):
+        is_sqlalchemy_imported = subprocess.check_output([
+            sys.executable, '-c', 'import sys, vcdb.command; print("sqlalchemy" in sys.modules)'
+        ]).decode('ascii').strip()
+        self.assertEqual('False', is_sqlalchemy_imported)
+
+    def test_fails_on_database_with_shard_folder(self):
+        try:
+            command.vcdb_command(['--shard-folder', tests.TEMP_FOLDER, 'file:///tmp/repo', 'sqlite://'])
+            self.fail()
+        except SystemExit as error:
+            self.assertEqual(error.code, 2)
+
     def assert_table_has_rows(self, cursor, table):
         sql_statement = 'select 1 from ' + table + ' limit 1'
         has_data = len(list(cursor.execute(sql_statement))) != 0
@@ -4,8 +4,11 @@ Test common classes and functions for vcdb.
 # Copyright (C) 2016 Thomas Aglassinger.
 # Distributed under the GNU Lesser General Public License v3 or later.
 import os
+import sqlite3
 import unittest
 
+import sqlalchemy
+
 from vcdb import common
 
 import tests
@@ -32,5 +35,51 @@ class OrmTest(unittest.TestCase):
         self.assertEqual(1, repository_count)
 
 
+class SchemaVersionTest(unittest.TestCase):
+    def setUp(self):
+        self.database_path = os.path.join(tests.TEMP_FOLDER, 'schemaversiontest.db')
+        common.ensure_is_removed(self.database_path)
+        self.engine_uri = 'sqlite:///' + self.database_path
+
+    def test_can_store_schema_version(self):
+        session = common.vcdb_session(self.engine_uri)
+        self.assertEqual(common.SCHEMA_VERSION, common.schema_version(session.get_bind()))
+        self.assertEqual(1, session.query(common.SchemaVersion).count())
+
+    def test_can_detect_uninitialized_database(self):
+        engine = sqlalchemy.create_engine(self.engine_uri)
+        self.assertEqual(0, common.schema_version(engine))
+
+    def test_can_migrate_database_without_schema_version(self):
+        engine = sqlalchemy.create_engine(self.engine_uri)
+        legacy_tables = [
+            table for table in common.DeclarativeBase.metadata.sorted_tables
+            if table.name != common.SchemaVersion.__tablename__
+        ]
+        common.DeclarativeBase.metadata.create_all(engine, tables=legacy_tables)
+        with engine.begin() as connection:
+            connection.execute(common.Repository.__table__.insert(), {'uri': 'file://localhost/tmp/tmp'})
+        session = common.vcdb_session(self.engine_uri)
+        self.assertEqual(common.SCHEMA_VERSION, common.schema_version(session.get_bind()))
+        self.assertEqual(1, session.query(common.Repository).count())
+
+    def test_fails_on_locked_database(self):
+        common.vcdb_session(self.engine_uri).get_bind().dispose()
+        engine = sqlalchemy.create_engine(self.engine_uri, connect_args={'timeout': 0})
+        with sqlite3.connect(self.database_path, isolation_level=None) as locking_database:
+            locking_database.execute('begin exclusive')
+            try:
+                self.assertRaises(sqlalchemy.exc.OperationalError, common.schema_version, engine)
+            finally:
+                locking_database.execute('rollback')
+        self.assertEqual(common.SCHEMA_VERSION, common.schema_version(engine))
+
+    def test_fails_on_newer_schema_version(self):
+        session = common.vcdb_session(self.engine_uri)
+        session.query(common.SchemaVersion).update({'version': common.SCHEMA_VERSION + 1})
+        session.commit()
+        self.assertRaises(common.VcdbError, common.vcdb_session, self.engine_uri)
+
+
 if __name__ == '__main__':
     unittest.main()
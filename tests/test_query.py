@@ -0,0 +1,107 @@
+"""
+Tests for common analytic queries.
+"""
+# Copyright (C) 2016 Thomas Aglassinger.
+# Distributed under the GNU Lesser General Public License v3 or later.
+import datetime
+import os
+import unittest
+
+from vcdb import common
+from vcdb import query
+
+import tests
+
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        self.database_path = os.path.join(tests.TEMP_FOLDER, 'querytest.db')
+        common.ensure_is_removed(self.database_path)
+        engine_uri = 'sqlite:///' + self.database_path
+        self.session = common.vcdb_session(engine_uri)
+        query.clear_cache()
+        self.repository = common.Repository(repository_id=1, uri='file://localhost/tmp/querytest')
+        self.session.add(self.repository)
+        self.add_change('1', 'alice', datetime.datetime(2016, 6, 30, 12, 0), ['/hello.py', '/README.txt'])
+        self.add_change('2', 'bob', datetime.datetime(2016, 7, 1, 8, 30), ['/hello.py'])
+        self.add_change('3', 'alice', datetime.datetime(2016, 7, 2, 9, 15), ['/hello.py'])
+
+    def add_change(self, commit_id, author, commit_time, paths, sync=True):
+        change_id = common.change_id_for(self.repository.repository_id, commit_id)
+        self.session.add(common.Change(
+            author=author,
+            change_id=change_id,
+            commit_id=commit_id,
+            commit_message='Changed stuff.',
+            commit_time=commit_time,
+            repository_id=self.repository.repository_id,
+        ))
+        for path in paths:
+            self.session.add(common.Path(
+                action='e',
+                change_id=change_id,
+                kind='f',
+                path=path,
+                repository_id=self.repository.repository_id,
+            ))
+        if sync:
+            self.repository.last_change_id = change_id
+        self.session.commit()
+
+    def test_can_query_top_authors(self):
+        self.assertEqual((('alice', 2), ('bob', 1)), query.top_authors(self.session))
+        self.assertEqual((('alice', 2),), query.top_authors(self.session, limit=1))
+        self.assertEqual((('alice', 2),), query.top_authors(self.session, None, 1))
+
+    def test_can_query_hot_paths(self):
+        self.assertEqual(
+            ((self.repository.uri, '/hello.py', 3), (self.repository.uri, '/README.txt', 1)),
+            query.hot_paths(self.session))
+
+    def test_can_query_hot_paths_in_multiple_repositories(self):
+        other_repository = common.Repository(repository_id=2, uri='file://localhost/tmp/other')
+        self.session.add(other_repository)
+        self.session.commit()
+        other_change_id = common.change_id_for(2, '1')
+        self.session.add(common.Change(
+            author='carol',
+            change_id=other_change_id,
+            commit_id='1',
+            commit_time=datetime.datetime(2016, 7, 5, 12, 0),
+            repository_id=2,
+        ))
+        self.session.add(common.Path(
+            action='a', change_id=other_change_id, kind='f', path='/README.txt', repository_id=2))
+        other_repository.last_change_id = other_change_id
+        self.session.commit()
+        self.assertEqual(
+            (
+                (self.repository.uri, '/hello.py', 3),
+                (other_repository.uri, '/README.txt', 1),
+                (self.repository.uri, '/README.txt', 1),
+            ),
+            query.hot_paths(self.session))
+        self.assertEqual((('/README.txt', 1),), query.hot_paths(self.session, other_repository.uri))
+
+    def test_can_query_activity(self):
+        self.assertEqual((('2016-06', 1), ('2016-07', 2)), query.activity(self.session))
+        self.assertEqual((('2016', 3),), query.activity(self.session, period='year'))
+
+    def test_can_filter_by_repository(self):
+        self.assertEqual(
+            (('alice', 2), ('bob', 1)), query.top_authors(self.session, self.repository.uri))
+        self.assertEqual((), query.top_authors(self.session, 'file://localhost/tmp/no_such_repository'))
+
+    def test_fails_on_broken_period(self):
+        self.assertRaises(common.VcdbError, query.activity, self.session, period='fortnight')
+
+    def test_can_reuse_cached_result_until_repository_is_synced(self):
+        self.assertEqual((('alice', 2), ('bob', 1)), query.top_authors(self.session))
+        self.add_change('4', 'bob', datetime.datetime(2016, 7, 3, 10, 0), [], sync=False)
+        self.assertEqual((('alice', 2), ('bob', 1)), query.top_authors(self.session, None, query.DEFAULT_LIMIT))
+        self.add_change('5', 'bob', datetime.datetime(2016, 7, 4, 10, 0), [])
+        self.assertEqual((('bob', 3), ('alice', 2)), query.top_authors(self.session))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+Tests for per repository shard databases.
+"""
+# Copyright (C) 2016 Thomas Aglassinger.
+# Distributed under the GNU Lesser General Public License v3 or later.
+import datetime
+import os
+import unittest
+from unittest import mock
+
+from vcdb import command
+from vcdb import common
+from vcdb import query
+from vcdb import shard
+
+import tests
+
+
+def _build_shard(shard_folder, repository_uri, author, commit_count):
+    session = common.vcdb_session(shard.shard_engine_uri(shard_folder, repository_uri))
+    repository = common.Repository(repository_id=1, uri=repository_uri)
+    session.add(repository)
+    for commit_number in range(1, commit_count + 1):
+        commit_id = str(commit_number)
+        change_id = common.change_id_for(1, commit_id)
+        session.add(common.Change(
+            author=author,
+            change_id=change_id,
+            commit_id=commit_id,
+            commit_message='Changed stuff.',
+            commit_time=datetime.datetime(2016, 7, commit_number, 12, 0),
+            repository_id=1,
+        ))
+        is_first_commit = commit_number == 1
+        session.add(common.Path(
+            action='a' if is_first_commit else 'c',
+            base_change_id=None if is_first_commit else common.change_id_for(1, str(commit_number - 1)),
+            base_path=None if is_first_commit else '/hello.py',
+            change_id=change_id,
+            kind='f',
+            path='/hello.py' if is_first_commit else '/hello_%d.py' % commit_number,
+            repository_id=1,
+        ))
+        repository.last_change_id = change_id
+    session.commit()
+    session.close()
+    session.get_bind().dispose()
+
+
+class ShardTest(unittest.TestCase):
+    def setUp(self):
+        self.shard_folder = os.path.join(tests.TEMP_FOLDER, 'shardtest')
+        common.ensure_folder_is_empty(self.shard_folder)
+        self.database_path = os.path.join(tests.TEMP_FOLDER, 'shardtest.db')
+        common.ensure_is_removed(self.database_path)
+        self.engine_uri = 'sqlite:///' + self.database_path
+        query.clear_cache()
+        _build_shard(self.shard_folder, 'file://localhost/tmp/alpha', 'alice', 2)
+        _build_shard(self.shard_folder, 'file://localhost/tmp/beta', 'bob', 3)
+
+    def test_can_find_shard_paths(self):
+        self.assertEqual(2, len(shard.shard_paths(self.shard_folder)))
+        self.assertNotEqual(
+            shard.shard_path(self.shard_folder, 'file://localhost/tmp/alpha'),
+            shard.shard_path(self.shard_folder, 'file://localhost/tmp/beta'))
+
+    def test_can_merge_shards(self):
+        self.assert_can_merge_shards()
+
+    def test_can_merge_shards_by_copying(self):
+        with mock.patch('vcdb.shard._can_attach', return_value=False):
+            self.assert_can_merge_shards()
+
+    def test_fails_on_merging_shard_with_other_schema_version(self):
+        shard_path = shard.shard_path(self.shard_folder, 'file://localhost/tmp/alpha')
+        shard_session = common.vcdb_session('sqlite:///' + shard_path)
+        shard_session.query(common.SchemaVersion).update({'version': common.SCHEMA_VERSION + 1})
+        shard_session.commit()
+        shard_session.get_bind().dispose()
+        session = common.vcdb_session(self.engine_uri)
+        self.assertRaises(common.VcdbError, shard.merge_shard, session, shard_path)
+        self.assertEqual(0, session.query(common.Change).count())
+
+    def assert_can_merge_shards(self):
+        session = common.vcdb_session(self.engine_uri)
+        for _ in range(2):
+            shard.merge_shards(session, self.shard_folder)
+            self.assertEqual((('bob', 3), ('alice', 2)), query.top_authors(session))
+        beta_repository = session.query(common.Repository).filter_by(uri='file://localhost/tmp/beta').one()
+        beta_repository_id = beta_repository.repository_id
+        self.assertEqual(common.change_id_for(beta_repository_id, '3'), beta_repository.last_change_id)
+        copied_path = session.query(common.Path).filter_by(
+            repository_id=beta_repository_id, path='/hello_3.py').one()
+        self.assertEqual(common.change_id_for(beta_repository_id, '3'), copied_path.change_id)
+        self.assertEqual(common.change_id_for(beta_repository_id, '2'), copied_path.base_change_id)
+
+    def test_can_merge_shards_using_command(self):
+        exit_code = command.vcdb_merge_command([self.shard_folder, self.engine_uri])
+        self.assertEqual(exit_code, 0)
+
+    def test_can_query_attached_shards(self):
+        session = shard.attached_shards_session(self.shard_folder)
+        self.assertEqual((('bob', 3), ('alice', 2)), query.top_authors(session))
+        self.assertEqual((('alice', 2),), query.top_authors(session, 'file://localhost/tmp/alpha'))
+        self.assertEqual(5, session.query(common.Change).count())
+        self.assertEqual(2, len(set(change.repository_id for change in session.query(common.Change))))
+        copied_paths = session.query(common.Path).filter(common.Path.base_change_id.isnot(None)).all()
+        self.assertEqual(3, len(copied_paths))
+        for copied_path in copied_paths:
+            self.assertEqual(copied_path.change_id[:3], copied_path.base_change_id[:3])
+
+    def test_fails_on_attaching_empty_shard_folder(self):
+        common.ensure_folder_is_empty(self.shard_folder)
+        self.assertRaises(common.VcdbError, shard.attached_shards_session, self.shard_folder)
+
+
+if __name__ == '__main__':
+    unittest.main()
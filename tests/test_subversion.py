@@ -3,12 +3,15 @@ Tests for Subversion repository.
 """
 # Copyright (C) 2016 Thomas Aglassinger.
 # Distributed under the GNU Lesser General Public License v3 or later.
+import datetime
 import logging
 import os
 import pathlib
 import subprocess
 import unittest
 import urllib
+from unittest import mock
+from xml.etree import ElementTree
 
 from vcdb.subversion import run_svn, write_svn_log_xml
 from vcdb import common
@@ -17,6 +20,76 @@ from vcdb import subversion
 import tests
 
 
+#: Log similar to ``svn log --verbose --xml`` for TestRepositoryBuilder.
+_SVN_LOG_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<log>
+<logentry revision="1">
+<author>alice</author>
+<date>2016-07-01T10:11:12.123456Z</date>
+<paths>
+<path action="A" prop-mods="false" text-mods="false" kind="dir">/hello</path>
+<path action="A" prop-mods="false" text-mods="false" kind="dir">/hello/trunk</path>
+</paths>
+<msg>Added project folder.</msg>
+</logentry>
+<logentry revision="2">
+<author>alice</author>
+<date>2016-07-01T10:12:13.5Z</date>
+<paths>
+<path action="A" prop-mods="false" text-mods="true" kind="file">/hello/trunk/hello.py</path>
+<path action="A" prop-mods="false" text-mods="false" kind="file">/hello/trunk/useless.txt</path>
+</paths>
+<msg>Added tool to greet.</msg>
+</logentry>
+<logentry revision="3">
+<author>bob</author>
+<date>2016-07-02T08:00:00.000001Z</date>
+<paths>
+<path action="D" prop-mods="false" text-mods="false" kind="file">/hello/trunk/useless.txt</path>
+<path copyfrom-path="/hello/trunk/hello.py" copyfrom-rev="2" action="A" prop-mods="false" text-mods="true"
+    kind="file">/hello/trunk/hello_again.py</path>
+</paths>
+<msg>Added another tool to greet.</msg>
+</logentry>
+<logentry revision="4">
+<author>bob</author>
+<date>2016-07-03T23:59:59.999999Z</date>
+<paths>
+<path copyfrom-path="/hello/trunk/hello.py" copyfrom-rev="2" action="A" prop-mods="false" text-mods="true"
+    kind="file">/hello/trunk/hallo.py</path>
+<path action="D" prop-mods="false" text-mods="false" kind="file">/hello/trunk/hello.py</path>
+<path action="R" prop-mods="false" text-mods="true" kind="file">/hello/trunk/hello_again.py</path>
+</paths>
+<msg></msg>
+</logentry>
+<logentry revision="5">
+<author>alice</author>
+<date>2016-07-04T07:08:09.1Z</date>
+<paths>
+<path copyfrom-path="/hello/trunk/hello_again.py" copyfrom-rev="4" action="A" prop-mods="false" text-mods="false"
+    kind="file">/hello/trunk/greet.py</path>
+<path copyfrom-path="/hello/trunk/hello_again.py" copyfrom-rev="4" action="A" prop-mods="false" text-mods="false"
+    kind="file">/hello/trunk/greet_again.py</path>
+<path action="D" prop-mods="false" text-mods="false" kind="file">/hello/trunk/hello_again.py</path>
+</paths>
+<msg>Split greeting.</msg>
+</logentry>
+<logentry revision="6">
+<author>bob</author>
+<date>2016-07-05T07:08:09.2Z</date>
+<paths>
+<path copyfrom-path="/hello/trunk/greet.py" copyfrom-rev="5" action="A" prop-mods="false" text-mods="false"
+    kind="file">/hello/trunk/zz_greet.py</path>
+<path copyfrom-path="/hello/trunk/greet.py" copyfrom-rev="5" action="A" prop-mods="false" text-mods="false"
+    kind="file">/hello/trunk/b_greet.py</path>
+<path action="D" prop-mods="false" text-mods="false" kind="file">/hello/trunk/greet.py</path>
+</paths>
+<msg>Renamed greeting.</msg>
+</logentry>
+</log>
+"""
+
+
 def _write_source(path, lines=None):
     assert path is not None
     with open(path, 'w', encoding='utf-8') as target_file:
@@ -133,6 +206,147 @@ class SubversionTest(unittest.TestCase):
         subversion.update_repository(self.session, repository_builder.repository_uri)
 
 
+class ConversionTest(unittest.TestCase):
+    def setUp(self):
+        self.log_root = ElementTree.fromstring(_SVN_LOG_XML)
+        self.repository = common.Repository(repository_id=1, uri='file://localhost/tmp/hello/')
+
+    def test_can_convert_commit_time(self):
+        for commit_time_text in [
+                '2016-07-01T10:11:12.123456Z', '2016-07-01T10:11:12.5Z', '2016-12-31T23:59:59.000001Z']:
+            self.assertEqual(
+                datetime.datetime.strptime(commit_time_text[:-1], subversion.STRFTIME_FORMAT),
+                subversion.commit_time_from_text(commit_time_text))
+
+    def test_fails_on_broken_commit_time(self):
+        self.assertRaises(ValueError, subversion.commit_time_from_text, '2016-13-01T10:11:12.123456Z')
+        self.assertRaises(ValueError, subversion.commit_time_from_text, 'yesterday')
+        self.assertRaises(ValueError, subversion.commit_time_from_text, '2016-07-01T10:11:12.1_2Z')
+        self.assertRaises(ValueError, subversion.commit_time_from_text, '2016-07-01T10:11: 2.5Z')
+        self.assertRaises(ValueError, subversion.commit_time_from_text, '2016-07-01T10:11:12.+5Z')
+
+    def test_can_convert_rows_identical_to_orm(self):
+        commit_id_to_change_id_map = {}
+        for logentry_element in self.log_root.iterfind('logentry'):
+            change = subversion.change_from_logentry_element(self.repository, logentry_element)
+            change_row = subversion.change_row_from_logentry_element(1, logentry_element)
+            self.assertEqual(
+                tuple(getattr(change, column_name) for column_name in subversion.ChangeRow._fields),
+                change_row)
+            paths = [
+                subversion.path_from_path_element(change, path_element)
+                for path_element in logentry_element.iterfind('paths/path')
+            ]
+            path_rows = subversion.path_rows_from_logentry_element(
+                change_row, logentry_element, commit_id_to_change_id_map)
+            self.assertEqual(
+                [tuple(getattr(path, column_name) for column_name in subversion.PathRow._fields) for path in paths],
+                path_rows)
+        self.assertEqual(
+            {
+                '2': common.change_id_for(1, '2'),
+                '4': common.change_id_for(1, '4'),
+                '5': common.change_id_for(1, '5'),
+            },
+            commit_id_to_change_id_map)
+
+    def test_can_resolve_moves(self):
+        logentry_element = self.log_root.find('logentry[@revision="4"]')
+        change_row = subversion.change_row_from_logentry_element(1, logentry_element)
+        path_rows = subversion.moves_resolved(
+            subversion.path_rows_from_logentry_element(change_row, logentry_element))
+        self.assertEqual(
+            [('m', '/hello/trunk/hallo.py'), ('e', '/hello/trunk/hello_again.py')],
+            [(path_row.action, path_row.path) for path_row in path_rows])
+
+    def test_can_resolve_move_of_path_copied_several_times(self):
+        logentry_element = self.log_root.find('logentry[@revision="5"]')
+        change_row = subversion.change_row_from_logentry_element(1, logentry_element)
+        path_rows = subversion.moves_resolved(
+            subversion.path_rows_from_logentry_element(change_row, logentry_element))
+        self.assertEqual(
+            [('m', '/hello/trunk/greet.py'), ('c', '/hello/trunk/greet_again.py')],
+            [(path_row.action, path_row.path) for path_row in path_rows])
+
+    def test_can_resolve_move_to_lowest_path_of_several_copies(self):
+        logentry_element = self.log_root.find('logentry[@revision="6"]')
+        change_row = subversion.change_row_from_logentry_element(1, logentry_element)
+        path_rows = subversion.moves_resolved(
+            subversion.path_rows_from_logentry_element(change_row, logentry_element))
+        self.assertEqual(
+            [('c', '/hello/trunk/zz_greet.py'), ('m', '/hello/trunk/b_greet.py')],
+            [(path_row.action, path_row.path) for path_row in path_rows])
+
+    def test_can_update_repository_from_log(self):
+        database_path = os.path.join(tests.TEMP_FOLDER, 'conversiontest.db')
+        common.ensure_is_removed(database_path)
+        session = common.vcdb_session('sqlite:///' + database_path)
+        repository = subversion.repository_for(session, self.repository.uri)
+        for _ in range(2):
+            subversion.update_repository_from_log(session, repository, self.log_root)
+            self.assertEqual(common.change_id_for(repository.repository_id, '6'), repository.last_change_id)
+            self.assertEqual(6, session.query(common.Change).count())
+            self.assertEqual(
+                ['a', 'a', 'a', 'a', 'c', 'c', 'c', 'd', 'e', 'm', 'm', 'm'],
+                sorted(path.action for path in session.query(common.Path)))
+            self.assertIsNone(session.query(common.Change).filter_by(commit_id='4').one().commit_message)
+
+
+#: XML similar to ``svn info --xml`` for a trunk last changed in revision 4.
+_SVN_INFO_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<info>
+<entry path="trunk" revision="7" kind="dir">
+<url>file:///tmp/hello/trunk</url>
+<repository>
+<root>file:///tmp/hello</root>
+</repository>
+<commit revision="4">
+<author>bob</author>
+<date>2016-07-03T23:59:59.999999Z</date>
+</commit>
+</entry>
+</info>
+"""
+
+
+class UpToDateTest(unittest.TestCase):
+    def setUp(self):
+        self.database_path = os.path.join(tests.TEMP_FOLDER, 'uptodatetest.db')
+        common.ensure_is_removed(self.database_path)
+        self.session = common.vcdb_session('sqlite:///' + self.database_path)
+        self.repository = subversion.repository_for(self.session, 'file:///tmp/hello/trunk')
+        svn_info_root = ElementTree.ElementTree(ElementTree.fromstring(_SVN_INFO_XML))
+        svn_info_patcher = mock.patch('vcdb.subversion.svn_info_elements', return_value=svn_info_root)
+        svn_info_patcher.start()
+        self.addCleanup(svn_info_patcher.stop)
+
+    def test_can_read_last_changed_revision(self):
+        self.assertEqual('4', subversion.svn_info_last_changed_revision(self.repository.uri))
+
+    def test_can_detect_up_to_date_repository(self):
+        self.assertFalse(subversion.is_up_to_date(self.repository))
+        self.repository.last_change_id = common.change_id_for(self.repository.repository_id, '3')
+        self.assertFalse(subversion.is_up_to_date(self.repository))
+        self.repository.last_change_id = common.change_id_for(self.repository.repository_id, '4')
+        self.assertTrue(subversion.is_up_to_date(self.repository))
+
+    def test_can_skip_up_to_date_repository(self):
+        self.repository.last_change_id = common.change_id_for(self.repository.repository_id, '4')
+        self.session.commit()
+        with mock.patch('vcdb.subversion.write_svn_log_xml') as write_svn_log_xml:
+            subversion.update_repository(self.session, self.repository.uri)
+        self.assertFalse(write_svn_log_xml.called)
+
+    def test_can_update_outdated_repository(self):
+        self.repository.last_change_id = common.change_id_for(self.repository.repository_id, '3')
+        self.session.commit()
+        with mock.patch('vcdb.subversion.write_svn_log_xml') as write_svn_log_xml:
+            with mock.patch('vcdb.subversion.ElementTree.parse', return_value=ElementTree.fromstring(_SVN_LOG_XML)):
+                subversion.update_repository(self.session, self.repository.uri)
+        self.assertTrue(write_svn_log_xml.called)
+        self.assertEqual(common.change_id_for(self.repository.repository_id, '6'), self.repository.last_change_id)
+
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
     unittest.main()
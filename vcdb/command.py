@@ -1,5 +1,9 @@
 """
 Command line interface for vcdb.
+
+To keep startup fast for ``--help``, ``--version`` and frequent runs from
+cron, modules depending on sqlalchemy are only imported once the command line
+has been parsed.
 """
 # Copyright (C) 2016 Thomas Aglassinger.
 # Distributed under the GNU Lesser General Public License v3 or later.
@@ -9,11 +13,7 @@ import os
 import sys
 import tempfile
 
-from sqlalchemy.exc import SQLAlchemyError
-
 import vcdb
-import vcdb.common
-import vcdb.subversion
 
 _log = logging.getLogger('vcdb')
 
@@ -26,17 +26,62 @@ def vcdb_command(arguments=None):
     parser = argparse.ArgumentParser(description='build SQL database from version control repository')
     parser.add_argument('repository', metavar='REPOSITORY', help='URI to repository')
     parser.add_argument(
-        'database', metavar='DATABASE', nargs='?', default=default_database,
+        'database', metavar='DATABASE', nargs='?',
         help='URI for sqlalchemy database engine; default: %s' % default_database)
+    parser.add_argument(
+        '--shard-folder', '-s', metavar='FOLDER',
+        help='store repository in its own SQLite database in FOLDER instead of DATABASE; '
+        'use vcdb-merge to combine such shards into a single database')
     parser.add_argument('--verbose', '-v', action='store_true', help='explain what is being done')
     parser.add_argument('--version', action='version', version='%(prog)s ' + vcdb.__version__)
     args = parser.parse_args(arguments)
+    if args.shard_folder is not None:
+        if args.database is not None:
+            parser.error('DATABASE must not be specified with --shard-folder')
+    elif args.database is None:
+        args.database = default_database
     if args.verbose:
         _log.setLevel(logging.DEBUG)
+    from sqlalchemy.exc import SQLAlchemyError
+    from vcdb import common, shard, subversion
     try:
+        if args.shard_folder is not None:
+            os.makedirs(args.shard_folder, exist_ok=True)
+            args.database = shard.shard_engine_uri(args.shard_folder, args.repository)
         _log.info('connect to database %s', args.database)
-        session = vcdb.common.vcdb_session(args.database)
-        vcdb.subversion.update_repository(session, args.repository)
+        session = common.vcdb_session(args.database)
+        subversion.update_repository(session, args.repository)
+        _log.info('finished')
+        result = 0
+    except KeyboardInterrupt:
+        _log.error('interrupted as requested by user')
+    except OSError as error:
+        _log.error(error)
+    except SQLAlchemyError as error:
+        _log.error('cannot access database: %s', error)
+    except Exception as error:
+        _log.exception(error)
+    return result
+
+
+def vcdb_merge_command(arguments=None):
+    result = 1
+    if arguments is None:
+        arguments = sys.argv[1:]
+    parser = argparse.ArgumentParser(description='merge shard databases built with vcdb --shard-folder')
+    parser.add_argument('shard_folder', metavar='FOLDER', help='folder containing shard databases')
+    parser.add_argument('database', metavar='DATABASE', help='URI for sqlalchemy database engine to merge into')
+    parser.add_argument('--verbose', '-v', action='store_true', help='explain what is being done')
+    parser.add_argument('--version', action='version', version='%(prog)s ' + vcdb.__version__)
+    args = parser.parse_args(arguments)
+    if args.verbose:
+        _log.setLevel(logging.DEBUG)
+    from sqlalchemy.exc import SQLAlchemyError
+    from vcdb import common, shard
+    try:
+        _log.info('connect to database %s', args.database)
+        session = common.vcdb_session(args.database)
+        shard.merge_shards(session, args.shard_folder)
         _log.info('finished')
         result = 0
     except KeyboardInterrupt:
@@ -55,5 +100,10 @@ def main():
     sys.exit(vcdb_command())
 
 
+def merge_main():
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(vcdb_merge_command())
+
+
 if __name__ == '__main__':
     main()
@@ -7,6 +7,7 @@ import os
 import shutil
 
 import sqlalchemy
+import sqlalchemy.exc
 from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, PrimaryKeyConstraint, String, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
@@ -136,8 +137,79 @@ class Path(DeclarativeBase):
 Repository.changes = relationship('Change', back_populates='repository')
 
 
+class SchemaVersion(DeclarativeBase):
+    """
+    The version of the vcdb data model stored in a database.
+    """
+    __tablename__ = 'vcdb_schema'
+    version = Column(Integer, nullable=False, primary_key=True)
+
+    def __repr__(self):
+        return '<SchemaVersion(version=%r)>' % self.version
+
+
+def _migrate_to_version_1(connection):
+    # NOTE: Databases created before the schema version was stored already
+    # contain all tables except vcdb_schema, which create_all() simply adds.
+    DeclarativeBase.metadata.create_all(connection)
+
+
+#: Functions to migrate a database to a certain schema version from the
+#: previous one.
+_VERSION_TO_MIGRATION_MAP = {
+    1: _migrate_to_version_1,
+}
+
+#: Current version of the data model.
+SCHEMA_VERSION = max(_VERSION_TO_MIGRATION_MAP.keys())
+
+
+def schema_version(engine):
+    """
+    The schema version stored in the database of ``engine`` or 0 if the
+    database has not been initialized yet.
+    """
+    assert engine is not None
+    schema_table = SchemaVersion.__table__
+    try:
+        with engine.connect() as connection:
+            result = connection.execute(sqlalchemy.select([sqlalchemy.func.max(schema_table.c.version)])).scalar()
+    except sqlalchemy.exc.DBAPIError:
+        # NOTE: Only check for the table after a failure so the usual case
+        # needs a single query; other errors such as locks must not cause
+        # a migration.
+        with engine.connect() as connection:
+            has_schema_table = engine.dialect.has_table(connection, schema_table.name)
+        if has_schema_table:
+            raise
+        result = None
+    if result is None:
+        result = 0
+    return result
+
+
+def migrate(engine, current_version):
+    """
+    Migrate database of ``engine`` from ``current_version`` to
+    :py:data:`SCHEMA_VERSION`.
+    """
+    assert engine is not None
+    assert current_version >= 0
+    if current_version > SCHEMA_VERSION:
+        raise VcdbError('database schema version is %d but must be at most %d; update vcdb to access it' % (
+            current_version, SCHEMA_VERSION))
+    schema_table = SchemaVersion.__table__
+    for version in range(current_version + 1, SCHEMA_VERSION + 1):
+        with engine.begin() as connection:
+            _VERSION_TO_MIGRATION_MAP[version](connection)
+            connection.execute(schema_table.delete())
+            connection.execute(schema_table.insert(), {'version': version})
+
+
 def vcdb_session(engine_uri):
     assert engine_uri is not None
     engine = sqlalchemy.create_engine(engine_uri)
-    DeclarativeBase.metadata.create_all(engine)
+    current_version = schema_version(engine)
+    if current_version != SCHEMA_VERSION:
+        migrate(engine, current_version)
     return sessionmaker(bind=engine)()
@@ -0,0 +1,154 @@
+"""
+Common analytic queries on a vcdb database.
+
+All queries return compact and immutable results consisting of tuples of plain
+tuples instead of ORM objects. Results are memoized in a cache that is keyed on the sync
+state of the repositories involved, meaning their
+``Repository.last_change_id``. As long as no new changes are synced, repeated
+calls only cost a single query to check the sync state.
+"""
+# Copyright (C) 2016 Thomas Aglassinger.
+# Distributed under the GNU Lesser General Public License v3 or later.
+import collections
+import functools
+import inspect
+import threading
+
+from sqlalchemy import desc, func
+
+import vcdb.common as common
+
+#: Default maximum number of rows returned by "top" queries.
+DEFAULT_LIMIT = 10
+
+#: Periods supported by :py:func:`activity` mapped to the number of
+#: characters to keep from an ISO formatted commit time.
+_PERIOD_TO_ISO_LENGTH_MAP = {
+    'year': 4,
+    'month': 7,
+    'day': 10,
+}
+
+_result_cache = {}
+_result_cache_lock = threading.Lock()
+
+
+def clear_cache():
+    """
+    Remove all memoized query results.
+    """
+    with _result_cache_lock:
+        _result_cache.clear()
+
+
+def sync_state(session, repository_uri=None):
+    """
+    Tuple of ``(repository_id, uri, last_change_id)`` for all repositories or
+    only the one with ``repository_uri``. The result changes whenever a
+    repository has been synced with new changes.
+    """
+    assert session is not None
+    query = session.query(
+        common.Repository.repository_id, common.Repository.uri, common.Repository.last_change_id)
+    if repository_uri is not None:
+        query = query.filter(common.Repository.uri == repository_uri)
+    return tuple(tuple(row) for row in query.order_by(common.Repository.repository_id))
+
+
+def _cached_query(query_function):
+    """
+    Decorator to memoize the result of ``query_function(session,
+    repository_uri=None, ...)`` until the sync state of the repositories it
+    covers changes.
+    """
+    query_signature = inspect.signature(query_function)
+
+    @functools.wraps(query_function)
+    def wrapper(session, *arguments, **keywords):
+        assert session is not None
+        # NOTE: Fill in defaults so equivalent calls share the same cache key.
+        name_to_argument_map = query_signature.bind(session, *arguments, **keywords).arguments
+        for name, parameter in query_signature.parameters.items():
+            if name not in name_to_argument_map:
+                name_to_argument_map[name] = parameter.default
+        del name_to_argument_map['session']
+        repository_uri = name_to_argument_map['repository_uri']
+        cache_key = (
+            str(session.get_bind().url),
+            query_function.__name__,
+            tuple(sorted(name_to_argument_map.items())),
+        )
+        current_sync_state = sync_state(session, repository_uri)
+        with _result_cache_lock:
+            cached_entry = _result_cache.get(cache_key)
+        if (cached_entry is not None) and (cached_entry[0] == current_sync_state):
+            result = cached_entry[1]
+        else:
+            result = query_function(session, **name_to_argument_map)
+            with _result_cache_lock:
+                _result_cache[cache_key] = (current_sync_state, result)
+        return result
+    return wrapper
+
+
+def _filtered_by_repository(query, repository_uri):
+    if repository_uri is not None:
+        query = query.join(common.Repository).filter(common.Repository.uri == repository_uri)
+    return query
+
+
+@_cached_query
+def top_authors(session, repository_uri=None, limit=DEFAULT_LIMIT):
+    """
+    Tuple of ``(author, change_count)`` tuples for the ``limit`` authors with
+    the most changes, most active first.
+    """
+    change_count = func.count(common.Change.change_id).label('change_count')
+    query = session.query(common.Change.author, change_count).select_from(common.Change)
+    query = _filtered_by_repository(query, repository_uri)
+    query = query.group_by(common.Change.author).order_by(desc(change_count), common.Change.author).limit(limit)
+    return tuple(tuple(row) for row in query)
+
+
+@_cached_query
+def hot_paths(session, repository_uri=None, limit=DEFAULT_LIMIT):
+    """
+    Tuple of ``(path, change_count)`` tuples for the ``limit`` files that have
+    been changed most often, most changed first. Without ``repository_uri``
+    the tuples are ``(uri, path, change_count)`` so the same path in different
+    repositories counts separately.
+    """
+    change_count = func.count(common.Path.change_id).label('change_count')
+    if repository_uri is None:
+        group_columns = [common.Repository.uri, common.Path.path]
+        query = session.query(*(group_columns + [change_count])).select_from(common.Path).join(common.Repository)
+    else:
+        group_columns = [common.Path.path]
+        query = session.query(common.Path.path, change_count).select_from(common.Path)
+        query = _filtered_by_repository(query, repository_uri)
+    query = query.filter(common.Path.kind == 'f')
+    query = query.group_by(*group_columns).order_by(desc(change_count), *group_columns).limit(limit)
+    return tuple(tuple(row) for row in query)
+
+
+@_cached_query
+def activity(session, repository_uri=None, period='month'):
+    """
+    Tuple of ``(period_start, change_count)`` tuples in chronological order
+    where ``period_start`` is a text such as '2016', '2016-07' or
+    '2016-07-01' depending on ``period``, which can be 'year', 'month' or
+    'day'.
+    """
+    try:
+        iso_length = _PERIOD_TO_ISO_LENGTH_MAP[period]
+    except KeyError:
+        raise common.VcdbError(
+            'period is %r but must be one of: %s' % (period, ', '.join(sorted(_PERIOD_TO_ISO_LENGTH_MAP.keys()))))
+    # NOTE: Group in Python because SQL functions to truncate dates are not
+    # portable across database engines.
+    query = session.query(common.Change.commit_time).select_from(common.Change)
+    query = _filtered_by_repository(query, repository_uri)
+    period_to_change_count_map = collections.Counter(
+        commit_time.isoformat()[:iso_length] for commit_time, in query
+    )
+    return tuple(sorted(period_to_change_count_map.items()))
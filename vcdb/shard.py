@@ -0,0 +1,282 @@
+"""
+Per repository shard databases.
+
+Each repository can be synced into its own SQLite database file located in a
+common shard folder. This allows syncing several repositories in parallel
+without waiting for a shared database lock. Shards can then be merged into a
+central database or queried directly by attaching them to an in-memory
+database that provides the usual tables as union views.
+
+Within a shard the only repository always has the ``repository_id`` 1. When
+merging or attaching shards, repository IDs and the prefixes of change IDs
+are remapped to match the combined database.
+"""
+# Copyright (C) 2016 Thomas Aglassinger.
+# Distributed under the GNU Lesser General Public License v3 or later.
+import glob
+import hashlib
+import logging
+import os
+
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import vcdb.common as common
+import vcdb.subversion as subversion
+
+#: Suffix of shard database files.
+SHARD_SUFFIX = '.db'
+
+#: Maximum number of shards that can be attached at the same time. This is
+#: the default of ``SQLITE_MAX_ATTACHED``.
+MAX_ATTACHED_SHARD_COUNT = 10
+
+#: Number of rows to copy at once when merging.
+MERGE_BATCH_SIZE = 1000
+
+#: Columns of the union views in the order of the shard tables.
+_REPOSITORY_COLUMN_NAMES = ['repository_id', 'uri', 'last_change_id']
+_CHANGE_COLUMN_NAMES = ['author', 'change_id', 'commit_id', 'commit_message', 'commit_time', 'repository_id']
+_PATH_COLUMN_NAMES = [
+    'repository_id', 'change_id', 'path', 'kind', 'action', 'base_change_id', 'base_path'
+]
+
+_log = logging.getLogger('vcdb.shard')
+
+
+def shard_path(shard_folder, repository_uri):
+    """
+    Path to the shard database for ``repository_uri`` in ``shard_folder``.
+    """
+    assert shard_folder is not None
+    assert repository_uri is not None
+    uri_hash = hashlib.sha1(repository_uri.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(shard_folder, 'vcdb_' + uri_hash + SHARD_SUFFIX)
+
+
+def shard_engine_uri(shard_folder, repository_uri):
+    return 'sqlite:///' + shard_path(shard_folder, repository_uri)
+
+
+def shard_paths(shard_folder):
+    """
+    Sorted list of paths to all shard databases in ``shard_folder``.
+    """
+    assert shard_folder is not None
+    return sorted(glob.glob(os.path.join(shard_folder, 'vcdb_*' + SHARD_SUFFIX)))
+
+
+def _remapped_change_id(change_id, repository_id):
+    if change_id is None:
+        result = None
+    else:
+        commit_id = change_id.split('-', 1)[1]
+        result = common.change_id_for(repository_id, commit_id)
+    return result
+
+
+def _shard_repository_uri(shard_connection, shard_path_to_check):
+    repository_table = common.Repository.__table__
+    uris = [row[0] for row in shard_connection.execute(sqlalchemy.select([repository_table.c.uri]))]
+    if len(uris) != 1:
+        raise common.VcdbError(
+            'shard %s must contain exactly 1 repository but contains %d' % (shard_path_to_check, len(uris)))
+    return uris[0]
+
+
+def _remapped_change_id_sql(column_name, repository_id):
+    # NOTE: Concatenating with NULL yields NULL, so NULL IDs remain NULL.
+    change_id_prefix = '%0*d-' % (common.MAX_REPOSITORY_ID_DIGITS, repository_id)
+    return "'%s' || substr(%s, %d)" % (change_id_prefix, column_name, len(change_id_prefix) + 1)
+
+
+def _remapped_columns_sql(column_names, repository_id):
+    """
+    SQL to select ``column_names`` from a shard table with repository and
+    change IDs remapped to ``repository_id``.
+    """
+    column_name_to_sql_map = {
+        'repository_id': '%d' % repository_id,
+        'change_id': _remapped_change_id_sql('change_id', repository_id),
+        'base_change_id': _remapped_change_id_sql('base_change_id', repository_id),
+        'last_change_id': _remapped_change_id_sql('last_change_id', repository_id),
+    }
+    return ', '.join(
+        '%s as %s' % (column_name_to_sql_map.get(column_name, column_name), column_name)
+        for column_name in column_names
+    )
+
+
+def _can_attach(session):
+    return session.get_bind().dialect.name == 'sqlite'
+
+
+def _merge_by_attaching(session, repository, shard_path_to_merge):
+    """
+    Merge shard into an SQLite database using ``insert ... select`` on the
+    attached shard, so no rows have to be copied through Python.
+    """
+    repository_id = repository.repository_id
+    merge_sqls = [
+        'delete from %s where repository_id = %d' % (common.Path.__tablename__, repository_id),
+        'delete from %s where repository_id = %d' % (common.Change.__tablename__, repository_id),
+    ]
+    for table_name, column_names in [
+            (common.Change.__tablename__, _CHANGE_COLUMN_NAMES),
+            (common.Path.__tablename__, _PATH_COLUMN_NAMES)]:
+        merge_sqls.append('insert into %s (%s) select %s from vcdb_shard.%s' % (
+            table_name, ', '.join(column_names), _remapped_columns_sql(column_names, repository_id), table_name))
+    merge_sqls.append('update %s set last_change_id = (select %s from vcdb_shard.%s) where repository_id = %d' % (
+        common.Repository.__tablename__,
+        _remapped_change_id_sql('last_change_id', repository_id),
+        common.Repository.__tablename__,
+        repository_id))
+
+    # NOTE: SQLite cannot attach or detach databases within a transaction.
+    session.commit()
+    with session.get_bind().connect() as connection:
+        connection.execute(sqlalchemy.text('attach database :shard_path as vcdb_shard'), {
+            'shard_path': shard_path_to_merge,
+        })
+        try:
+            with connection.begin():
+                for merge_sql in merge_sqls:
+                    connection.execute(sqlalchemy.text(merge_sql))
+        finally:
+            connection.execute(sqlalchemy.text('detach database vcdb_shard'))
+    session.expire(repository)
+
+
+def _copy_rows(shard_connection, target_connection, table, repository_id, change_id_column_names):
+    select_rows = sqlalchemy.select([table])
+    insert_rows = table.insert()
+    shard_result = shard_connection.execute(select_rows)
+    try:
+        rows = shard_result.fetchmany(MERGE_BATCH_SIZE)
+        while rows:
+            values_to_insert = []
+            for row in rows:
+                values = dict(row)
+                values['repository_id'] = repository_id
+                for change_id_column_name in change_id_column_names:
+                    values[change_id_column_name] = _remapped_change_id(
+                        values[change_id_column_name], repository_id)
+                values_to_insert.append(values)
+            target_connection.execute(insert_rows, values_to_insert)
+            rows = shard_result.fetchmany(MERGE_BATCH_SIZE)
+    finally:
+        shard_result.close()
+
+
+def _merge_by_copying(session, repository, shard_engine):
+    """
+    Merge shard into any kind of database by copying rows in batches.
+    """
+    repository_id = repository.repository_id
+    with shard_engine.connect() as shard_connection:
+        target_connection = session.connection()
+        change_table = common.Change.__table__
+        path_table = common.Path.__table__
+        target_connection.execute(path_table.delete().where(path_table.c.repository_id == repository_id))
+        target_connection.execute(change_table.delete().where(change_table.c.repository_id == repository_id))
+        _copy_rows(shard_connection, target_connection, change_table, repository_id, ['change_id'])
+        _copy_rows(
+            shard_connection, target_connection, path_table, repository_id, ['change_id', 'base_change_id'])
+        repository_table = common.Repository.__table__
+        last_change_id = shard_connection.execute(
+            sqlalchemy.select([repository_table.c.last_change_id])).scalar()
+        repository.last_change_id = _remapped_change_id(last_change_id, repository_id)
+    session.commit()
+
+
+def merge_shard(session, shard_path_to_merge):
+    """
+    Merge the shard database at ``shard_path_to_merge`` into the central
+    database of ``session``, replacing all changes and paths previously
+    merged for the same repository.
+    """
+    assert session is not None
+    assert shard_path_to_merge is not None
+
+    shard_engine = sqlalchemy.create_engine('sqlite:///' + shard_path_to_merge)
+    try:
+        shard_schema_version = common.schema_version(shard_engine)
+        if shard_schema_version != common.SCHEMA_VERSION:
+            raise common.VcdbError('shard %s must have schema version %d but has %d' % (
+                shard_path_to_merge, common.SCHEMA_VERSION, shard_schema_version))
+        with shard_engine.connect() as shard_connection:
+            repository_uri = _shard_repository_uri(shard_connection, shard_path_to_merge)
+        _log.info('merge shard %s for repository %s', shard_path_to_merge, repository_uri)
+        repository = subversion.repository_for(session, repository_uri)
+        if _can_attach(session):
+            _merge_by_attaching(session, repository, shard_path_to_merge)
+        else:
+            _merge_by_copying(session, repository, shard_engine)
+    finally:
+        shard_engine.dispose()
+
+
+def merge_shards(session, shard_folder):
+    """
+    Merge all shard databases in ``shard_folder`` into the central database
+    of ``session``.
+    """
+    assert session is not None
+    assert shard_folder is not None
+    for shard_path_to_merge in shard_paths(shard_folder):
+        merge_shard(session, shard_path_to_merge)
+
+
+def _union_view_sql(view_name, schema_to_select_sql_map):
+    return 'create temp view %s as %s' % (view_name, ' union all '.join(
+        'select %s from %s.%s' % (select_sql, schema, view_name)
+        for schema, select_sql in sorted(schema_to_select_sql_map.items())
+    ))
+
+
+def _union_view_sqls(repository_count):
+    repository_select_sql_map = {}
+    change_select_sql_map = {}
+    path_select_sql_map = {}
+    for repository_id in range(1, repository_count + 1):
+        schema = 'shard%d' % repository_id
+        repository_select_sql_map[schema] = _remapped_columns_sql(_REPOSITORY_COLUMN_NAMES, repository_id)
+        change_select_sql_map[schema] = _remapped_columns_sql(_CHANGE_COLUMN_NAMES, repository_id)
+        path_select_sql_map[schema] = _remapped_columns_sql(_PATH_COLUMN_NAMES, repository_id)
+    return [
+        _union_view_sql(common.Repository.__tablename__, repository_select_sql_map),
+        _union_view_sql(common.Change.__tablename__, change_select_sql_map),
+        _union_view_sql(common.Path.__tablename__, path_select_sql_map),
+    ]
+
+
+def attached_shards_session(shard_folder):
+    """
+    Session on an in-memory database that attaches all shards in
+    ``shard_folder`` and provides the tables of :py:mod:`vcdb.common` as
+    read only union views on them without copying any data.
+    """
+    assert shard_folder is not None
+    shard_paths_to_attach = shard_paths(shard_folder)
+    shard_count = len(shard_paths_to_attach)
+    if shard_count == 0:
+        raise common.VcdbError('shard folder must contain at least 1 shard: %s' % shard_folder)
+    if shard_count > MAX_ATTACHED_SHARD_COUNT:
+        raise common.VcdbError('shard folder must contain at most %d shards but contains %d: %s' % (
+            MAX_ATTACHED_SHARD_COUNT, shard_count, shard_folder))
+    union_view_sqls = _union_view_sqls(shard_count)
+    engine = sqlalchemy.create_engine('sqlite://')
+
+    @event.listens_for(engine, 'connect')
+    def attach_shards(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        try:
+            for shard_index, shard_path_to_attach in enumerate(shard_paths_to_attach):
+                cursor.execute('attach database ? as shard%d' % (shard_index + 1), (shard_path_to_attach,))
+            for union_view_sql in union_view_sqls:
+                cursor.execute(union_view_sql)
+        finally:
+            cursor.close()
+
+    return sessionmaker(bind=engine)()
@@ -3,6 +3,7 @@ Utility functions to work with Subversion.
 """
 # Copyright (C) 2016 Thomas Aglassinger.
 # Distributed under the GNU Lesser General Public License v3 or later.
+import collections
 import datetime
 import io
 import logging
@@ -26,63 +27,181 @@ _SUBVERSION_ACTION_TO_PATH_ACTION_MAP = {
 }
 _log = logging.getLogger('vcdb.subversion')
 
+#: Number of rows to send to the database with a single insert.
+INSERT_BATCH_SIZE = 1000
+
+#: Column values of a :py:class:`vcdb.common.Change` without the ORM overhead.
+ChangeRow = collections.namedtuple(
+    'ChangeRow', ['author', 'change_id', 'commit_id', 'commit_message', 'commit_time', 'repository_id'])
+
+#: Column values of a :py:class:`vcdb.common.Path` without the ORM overhead.
+PathRow = collections.namedtuple(
+    'PathRow', ['action', 'base_change_id', 'base_path', 'change_id', 'kind', 'path', 'repository_id'])
+
+# Length of an ISO time without fraction, for example '2016-07-01T12:34:56'.
+_ISO_TIME_WITHOUT_FRACTION_LENGTH = 19
+
+
+def commit_time_from_text(commit_time_text):
+    """
+    The time represented by ``commit_time_text`` in the format
+    '2016-07-01T12:34:56.123456Z' as used by ``svn log --xml``. This is
+    considerably faster than ``datetime.strptime()`` but falls back to it for
+    texts in any other format.
+    """
+    text_length = len(commit_time_text)
+    # NOTE: Check for digits because int() also accepts for example ' ', '+'
+    # and '_', which strptime() rejects.
+    has_fixed_format = (
+        (_ISO_TIME_WITHOUT_FRACTION_LENGTH + 2 < text_length <= _ISO_TIME_WITHOUT_FRACTION_LENGTH + 8)
+        and (commit_time_text[4] == '-') and (commit_time_text[7] == '-') and (commit_time_text[10] == 'T')
+        and (commit_time_text[13] == ':') and (commit_time_text[16] == ':') and (commit_time_text[19] == '.')
+        and (commit_time_text[-1] == 'Z')
+        and (commit_time_text[0:4] + commit_time_text[5:7] + commit_time_text[8:10]
+             + commit_time_text[11:13] + commit_time_text[14:16] + commit_time_text[17:19]
+             + commit_time_text[20:-1]).isdigit()
+    )
+    if has_fixed_format:
+        try:
+            result = datetime.datetime(
+                int(commit_time_text[0:4]),
+                int(commit_time_text[5:7]),
+                int(commit_time_text[8:10]),
+                int(commit_time_text[11:13]),
+                int(commit_time_text[14:16]),
+                int(commit_time_text[17:19]),
+                int(commit_time_text[20:-1].ljust(6, '0')),
+            )
+        except ValueError:
+            has_fixed_format = False
+    if not has_fixed_format:
+        # HACK: Strip the trailing 'Z' which seems to be there for reasons unknown.
+        result = datetime.datetime.strptime(commit_time_text[:-1], STRFTIME_FORMAT)
+    return result
+
+
+def change_row_from_logentry_element(repository_id, logentry_element):
+    """
+    :py:class:`ChangeRow` for ``logentry_element``.
+    """
+    assert logentry_element.tag == 'logentry'
+    commit_id = logentry_element.attrib['revision']
+    # NOTE: Use find().text instead of findtext() so empty elements yield None.
+    return ChangeRow(
+        author=logentry_element.find('author').text,
+        change_id=common.change_id_for(repository_id, commit_id),
+        commit_id=commit_id,
+        commit_message=logentry_element.find('msg').text,
+        commit_time=commit_time_from_text(logentry_element.find('date').text),
+        repository_id=repository_id,
+    )
 
-def path_from_path_element(change, path_element):
-    assert change is not None
-    assert path_element is not None
 
-    path = path_element.text
-    svn_kind = path_element.attrib['kind']
+def _path_row_from_path_element(change_id, repository_id, path_element, commit_id_to_change_id_map):
+    attributes = path_element.attrib
+    svn_kind = attributes['kind']
     try:
         kind = _SUBVERSION_KIND_TO_PATH_KIND_MAP[svn_kind]
     except KeyError:
         assert False, 'kind=%r must be added to _SUBVERSION_KIND_TO_PATH_KIND_MAP' % svn_kind
-    svn_action = path_element.attrib['action']
+    svn_action = attributes['action']
     try:
         action = _SUBVERSION_ACTION_TO_PATH_ACTION_MAP[svn_action]
     except KeyError:
         assert False, 'action=%r must be added to _SUBVERSION_ACTION_TO_PATH_ACTION_MAP' % svn_action
 
-    base_commit_id = path_element.attrib.get('copyfrom-rev')
-    base_path = path_element.attrib.get('copyfrom-path')
+    base_commit_id = attributes.get('copyfrom-rev')
+    base_path = attributes.get('copyfrom-path')
     if base_commit_id is not None:
         action = 'c'
-        base_change_id = common.change_id_for(change.repository_id, base_commit_id)
+        base_change_id = commit_id_to_change_id_map.get(base_commit_id)
+        if base_change_id is None:
+            base_change_id = common.change_id_for(repository_id, base_commit_id)
+            commit_id_to_change_id_map[base_commit_id] = base_change_id
     else:
         if base_path is not None:
             raise common.VcdbError('on base_commit_id=None, base_path must be None but is: %r' % base_path)
         base_change_id = None
-    result = common.Path(
+    return PathRow(
         action=action,
         base_change_id=base_change_id,
         base_path=base_path,
-        change_id=change.change_id,
-        kind=kind, path=path,
-        repository_id=change.repository_id)
-    return result
+        change_id=change_id,
+        kind=kind,
+        path=path_element.text,
+        repository_id=repository_id,
+    )
+
+
+def path_rows_from_logentry_element(change_row, logentry_element, commit_id_to_change_id_map=None):
+    """
+    List of :py:class:`PathRow` for all paths of ``logentry_element``.
+    Change IDs of copy sources are memoized in ``commit_id_to_change_id_map``,
+    which can be shared across several calls.
+    """
+    assert change_row is not None
+    assert logentry_element is not None
+
+    if commit_id_to_change_id_map is None:
+        commit_id_to_change_id_map = {}
+    return [
+        _path_row_from_path_element(
+            change_row.change_id, change_row.repository_id, path_element, commit_id_to_change_id_map)
+        for path_element in logentry_element.iterfind('paths/path')
+    ]
+
+
+def path_from_path_element(change, path_element):
+    assert change is not None
+    assert path_element is not None
+
+    path_row = _path_row_from_path_element(change.change_id, change.repository_id, path_element, {})
+    return common.Path(**path_row._asdict())
 
 
 def change_from_logentry_element(repository, logentry_element):
-    assert logentry_element.tag == 'logentry'
-    author = logentry_element.find('author').text
-    commit_id = logentry_element.attrib['revision']
-    commit_message = logentry_element.find('msg').text
-    commit_time_text = logentry_element.find('date').text
-    # HACK: Strip the trailing 'Z' which seems to be there for reasons unknown.
-    commit_time_text = commit_time_text[:-1]
-    commit_time = datetime.datetime.strptime(commit_time_text, STRFTIME_FORMAT)
-    change_id = common.change_id_for(repository.repository_id, commit_id)
-    result = common.Change(
-        author=author,
-        change_id=change_id,
-        commit_id=commit_id,
-        commit_time=commit_time,
-        commit_message=commit_message,
-        repository_id=repository.repository_id
-    )
+    change_row = change_row_from_logentry_element(repository.repository_id, logentry_element)
+    return common.Change(**change_row._asdict())
+
+
+def moves_resolved(path_rows):
+    """
+    Copy of ``path_rows`` where copied paths whose base path has been
+    deleted in the same change have the action 'm' (moved) and the deleted
+    paths are removed. If the same base path is copied several times, only
+    the copy with the lowest path counts as moved.
+    """
+    deleted_paths = set(path_row.path for path_row in path_rows if path_row.action == 'd')
+    # NOTE: Claim deleted paths in the order of the primary key (change_id, path)
+    # to match the previous implementation, which queried the copied paths
+    # from the database.
+    moved_paths = set()
+    for copied_path_row in sorted(
+            (path_row for path_row in path_rows if path_row.action == 'c'),
+            key=lambda path_row: path_row.path):
+        if copied_path_row.base_path in deleted_paths:
+            deleted_paths.remove(copied_path_row.base_path)
+            moved_paths.add(copied_path_row.path)
+    if moved_paths:
+        moved_base_paths = set(
+            path_row.base_path for path_row in path_rows if path_row.path in moved_paths)
+        result = []
+        for path_row in path_rows:
+            if path_row.path in moved_paths:
+                result.append(path_row._replace(action='m'))
+            elif (path_row.action != 'd') or (path_row.path not in moved_base_paths):
+                result.append(path_row)
+    else:
+        result = path_rows
     return result
 
 
+def _insert_rows(connection, table, rows):
+    if rows:
+        connection.execute(table.insert(), [row._asdict() for row in rows])
+        del rows[:]
+
+
 def run_svn(command, *options):
     """
     Run a subversion command using the svn command line client.
@@ -146,6 +265,32 @@ def svn_info_revision(repository_uri):
     return entry_element.attrib['revision']
 
 
+def svn_info_last_changed_revision(uri):
+    """
+    The revision in which ``uri`` or anything below it has been changed last.
+    """
+    commit_xpath = 'entry/commit[@revision]'
+    svn_info_root = svn_info_elements(uri)
+    try:
+        commit_element = svn_info_root.findall(commit_xpath)[0]
+    except IndexError:
+        raise common.VcdbError('XML from "svn info" must contain an element matching XPath %s' % commit_xpath)
+    return commit_element.attrib['revision']
+
+
+def is_up_to_date(repository):
+    """
+    ``True`` if ``repository`` already contains the last change of its URI.
+    """
+    assert repository is not None
+    if repository.last_change_id is None:
+        result = False
+    else:
+        last_synced_commit_id = repository.last_change_id.split('-', 1)[1]
+        result = last_synced_commit_id == svn_info_last_changed_revision(repository.uri)
+    return result
+
+
 def repository_for(session, repository_uri):
     assert session is not None
     assert repository_uri is not None
@@ -168,39 +313,54 @@ def update_repository(session, repository_uri):
     assert repository_uri is not None
 
     repository = repository_for(session, repository_uri)
-    revision = '0:HEAD'  # TODO: Update starting revision from last change.
-    svn_log_xml_file = tempfile.NamedTemporaryFile(suffix='.xml', prefix='vcdb_svn_log_')
-    svn_log_xml_path = svn_log_xml_file.name
-    svn_log_xml_file.close()  # Close the temp file, we just need its name.
-
-    # Extract and log parse it.
-    write_svn_log_xml(svn_log_xml_path, repository_uri, revision)
-    _log.info('read subversion log from %s', svn_log_xml_path)
-    log_root = ElementTree.parse(svn_log_xml_path)
-
-    # Process log and add changes and paths.
-    for logentry_element in log_root.findall('logentry[@revision]'):
-        change = change_from_logentry_element(repository, logentry_element)
-        _log.debug('  add change: %s', change)
-        session.merge(change)
-        for path_element in logentry_element.findall('paths/path'):
-            path = path_from_path_element(change, path_element)
-            _log.debug('    add path: %s', path)
-            session.merge(path)
-        copied_paths = session.query(common.Path).filter(
-            common.Path.change_id == change.change_id,
-            common.Path.action == 'c'
-        ).all()
-        # Change action of copied paths with base_path removed to 'm' (moved).
-        for copied_path in copied_paths:
-            deleted_path_count = session.query(common.Path).filter(
-                common.Path.change_id == change.change_id,
-                common.Path.action == 'd',
-                common.Path.path == copied_path.base_path
-            ).delete()
-            if deleted_path_count == 1:
-                copied_path.action = 'm'
-            else:
-                assert deleted_path_count == 0
-    session.commit()
+    if is_up_to_date(repository):
+        _log.info('repository is already up to date: %s', repository_uri)
+    else:
+        revision = '0:HEAD'  # TODO: Update starting revision from last change.
+        svn_log_xml_file = tempfile.NamedTemporaryFile(suffix='.xml', prefix='vcdb_svn_log_')
+        svn_log_xml_path = svn_log_xml_file.name
+        svn_log_xml_file.close()  # Close the temp file, we just need its name.
+
+        # Extract and log parse it.
+        write_svn_log_xml(svn_log_xml_path, repository_uri, revision)
+        _log.info('read subversion log from %s', svn_log_xml_path)
+        log_root = ElementTree.parse(svn_log_xml_path)
+        update_repository_from_log(session, repository, log_root)
+
+
+def update_repository_from_log(session, repository, log_root):
+    """
+    Replace all changes and paths of ``repository`` by the ones in
+    ``log_root``, which is the XML from ``svn log --verbose --xml``.
+    """
+    assert session is not None
+    assert repository is not None
+    assert log_root is not None
 
+    repository_id = repository.repository_id
+    connection = session.connection()
+    change_table = common.Change.__table__
+    path_table = common.Path.__table__
+    connection.execute(path_table.delete().where(path_table.c.repository_id == repository_id))
+    connection.execute(change_table.delete().where(change_table.c.repository_id == repository_id))
+    change_rows = []
+    path_rows = []
+    commit_id_to_change_id_map = {}
+    change_row = None
+    for logentry_element in log_root.iterfind('logentry[@revision]'):
+        change_row = change_row_from_logentry_element(repository_id, logentry_element)
+        _log.debug('  add change: %s', change_row)
+        change_rows.append(change_row)
+        for path_row in moves_resolved(
+                path_rows_from_logentry_element(change_row, logentry_element, commit_id_to_change_id_map)):
+            _log.debug('    add path: %s', path_row)
+            path_rows.append(path_row)
+        if len(change_rows) + len(path_rows) >= INSERT_BATCH_SIZE:
+            # NOTE: Insert changes before paths so the paths' foreign keys already exist.
+            _insert_rows(connection, change_table, change_rows)
+            _insert_rows(connection, path_table, path_rows)
+    _insert_rows(connection, change_table, change_rows)
+    _insert_rows(connection, path_table, path_rows)
+    if change_row is not None:
+        repository.last_change_id = change_row.change_id
+    session.commit()